@@ -2,19 +2,181 @@ from flask import Flask, render_template, request, redirect, url_for, flash, ses
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import secrets
+import os
+import threading
+from archive import attach_archive, is_archive_attached
+from backup import start_backup_scheduler
+from database import create_tables
+from group_commit import GroupCommitWriter
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)  # Secure random key for session management
+app.config.setdefault('DATABASE', "fyay.db")
+app.config.setdefault('ARCHIVE_DATABASE', "fyay_archive.db")
 
-def get_db_connection():
+# Optional group commit of event applications, e.g. FYAY_GROUP_COMMIT=1 when popular events open
+app.config.setdefault('GROUP_COMMIT', os.environ.get('FYAY_GROUP_COMMIT') == '1')
+app.config.setdefault('GROUP_COMMIT_MAX_BATCH', int(os.environ.get('FYAY_GROUP_COMMIT_MAX_BATCH', 64)))
+app.config.setdefault('GROUP_COMMIT_MAX_WAIT_MS', float(os.environ.get('FYAY_GROUP_COMMIT_MAX_WAIT_MS', 5)))
+
+migrated_databases = set()
+migration_lock = threading.Lock()
+
+def get_db_connection(include_archive=False):
     """
     Establish a connection to the SQLite database.
+    The first connection to a database brings its schema up to date, so existing
+    installs pick up new tables and columns without re-running database.py.
+    With include_archive=True the archive database is attached as well, and the
+    all_purchases / all_inventoryTransactions views cover both hot and archived rows.
     Returns:
         conn: SQLite connection object
     """
-    conn = sqlite3.connect("fyay.db", timeout=10)
+    with migration_lock:
+        if app.config['DATABASE'] not in migrated_databases:
+            create_tables(app.config['DATABASE'], app.config['ARCHIVE_DATABASE'])
+            migrated_databases.add(app.config['DATABASE'])
+
+    conn = sqlite3.connect(app.config['DATABASE'], timeout=10)
     conn.row_factory = sqlite3.Row  # Access database rows like dictionaries
+    if include_archive:
+        attach_archive(conn, app.config['ARCHIVE_DATABASE'])
     return conn
 
+def fetch_accounts(conn, include_archive=False):
+    """
+    Fetch every user with a summary of the events they applied to.
+    Archived applications are only included when include_archive is True.
+    """
+    purchases_table = 'all_purchases' if include_archive else 'purchases'
+    return conn.execute(f'''
+        SELECT users.id AS user_id, users.full_name, users.email, users.role,
+               GROUP_CONCAT(events.event_name || " (" || purchases.hours || " hours on " || purchases.created_at || ")") AS events_applied
+        FROM users
+        LEFT JOIN {purchases_table} AS purchases ON users.id = purchases.user_id
+        LEFT JOIN events ON purchases.event_id = events.id
+        GROUP BY users.id
+    ''').fetchall()
+
+def reserve_seat(conn, event_id, hours):
+    """
+    Take one seat and `hours` booked hours on an event if its limits allow it.
+    Must run in the same transaction that records the application so the
+    counters and purchases are committed (or rolled back) together.
+    Returns True if the seat was taken.
+    """
+    cursor = conn.execute('''
+        UPDATE events SET seats_filled = seats_filled + 1, hours_booked = hours_booked + ?
+        WHERE id = ?
+          AND (capacity IS NULL OR seats_filled < capacity)
+          AND (max_hours IS NULL OR hours_booked + ? <= max_hours)
+    ''', (hours, event_id, hours))
+    return cursor.rowcount == 1
+
+def write_applications(conn, applications):
+    """
+    Record (user_id, event_id, hours, description) applications inside the caller's transaction.
+    Each one takes a seat if the event has room and nobody is waiting for it, and is
+    waitlisted otherwise, so newcomers never skip the queue; the rows are then inserted
+    with one executemany per table.
+    Returns True (applied) or False (waitlisted) for each application, in order.
+    """
+    queued_events = set()  # Events with a waitlist, including entries queued earlier in this batch
+    results = []
+    for _, event_id, hours, _ in applications:
+        if event_id not in queued_events and conn.execute(
+            'SELECT 1 FROM waitlist WHERE event_id = ? LIMIT 1', (event_id,)
+        ).fetchone():
+            queued_events.add(event_id)
+
+        applied = event_id not in queued_events and reserve_seat(conn, event_id, hours)
+        if not applied:
+            queued_events.add(event_id)
+        results.append(applied)
+
+    conn.executemany(
+        'INSERT INTO purchases (user_id, event_id, hours, description) VALUES (?, ?, ?, ?)',
+        [application for application, applied in zip(applications, results) if applied]
+    )
+    conn.executemany(
+        'INSERT INTO waitlist (user_id, event_id, hours, description) VALUES (?, ?, ?, ?)',
+        [application for application, applied in zip(applications, results) if not applied]
+    )
+    return results
+
+application_writer = None
+application_writer_lock = threading.Lock()
+
+def get_application_writer():
+    """
+    Return the group-commit writer for event applications, starting it on first use
+    and again if the previous writer thread has died.
+    """
+    global application_writer
+    with application_writer_lock:
+        if application_writer is None or not application_writer.is_alive():
+            application_writer = GroupCommitWriter(
+                get_db_connection,
+                write_applications,
+                max_batch_size=app.config['GROUP_COMMIT_MAX_BATCH'],
+                max_wait=app.config['GROUP_COMMIT_MAX_WAIT_MS'] / 1000
+            )
+        return application_writer
+
+def promote_waitlist(conn, event_id):
+    """
+    Move waitlisted applications into purchases, oldest first, while the event has room.
+    Stops at the first application that does not fit so the waitlist stays FIFO.
+    Returns the number of promoted applications.
+    """
+    promoted = 0
+    while True:
+        entry = conn.execute(
+            'SELECT * FROM waitlist WHERE event_id = ? ORDER BY id LIMIT 1', (event_id,)
+        ).fetchone()
+        if not entry or not reserve_seat(conn, event_id, entry['hours']):
+            return promoted
+
+        conn.execute(
+            'INSERT INTO purchases (user_id, event_id, hours, description) VALUES (?, ?, ?, ?)',
+            (entry['user_id'], event_id, entry['hours'], entry['description'])
+        )
+        conn.execute('DELETE FROM waitlist WHERE id = ?', (entry['id'],))
+        promoted += 1
+
+def cancel_applications(conn, user_id, event_id=None):
+    """
+    Remove a user's applications and waitlist entries (for every event, or only event_id),
+    free their seats and promote waitlisted users into them.
+    Event counters include archived applications, so archived ones are cancelled too:
+    conn must come from get_db_connection(include_archive=True).
+    Opens a write transaction if none is active; the caller commits.
+    Returns the number of cancelled applications and waitlist entries.
+    """
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+    event_filter = '' if event_id is None else ' AND event_id = ?'
+    params = (user_id,) if event_id is None else (user_id, event_id)
+
+    freed = conn.execute(
+        f'SELECT event_id, COUNT(*) AS seats, SUM(hours) AS hours FROM all_purchases WHERE user_id = ?{event_filter} GROUP BY event_id',
+        params
+    ).fetchall()
+
+    conn.execute(f'DELETE FROM purchases WHERE user_id = ?{event_filter}', params)
+    if is_archive_attached(conn):
+        conn.execute(f'DELETE FROM archive.purchases WHERE user_id = ?{event_filter}', params)
+    cancelled = conn.execute(f'DELETE FROM waitlist WHERE user_id = ?{event_filter}', params).rowcount
+
+    for row in freed:
+        conn.execute(
+            'UPDATE events SET seats_filled = seats_filled - ?, hours_booked = hours_booked - ? WHERE id = ?',
+            (row['seats'], row['hours'], row['event_id'])
+        )
+        promote_waitlist(conn, row['event_id'])
+        cancelled += row['seats']
+    return cancelled
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -38,22 +200,29 @@ def events():
     displaying all events.
     Highlights events that the user has already applied to.
     """
-    conn = get_db_connection()
+    # Archived applications still hold their seats, so they count as applied
+    conn = get_db_connection(include_archive=True)
 
     # Fetch all events
     events = conn.execute('SELECT * FROM events').fetchall()
 
-    # Determine which events the user has applied to
+    # Determine which events the user has applied to or is waitlisted for
     applied_event_ids = []
+    waitlisted_event_ids = []
     if 'user_id' in session:
         applied_events = conn.execute(
-            'SELECT event_id FROM purchases WHERE user_id = ?', (session['user_id'],)
+            'SELECT event_id FROM all_purchases WHERE user_id = ?', (session['user_id'],)
         ).fetchall()
         applied_event_ids = [row['event_id'] for row in applied_events]
+        waitlisted_events = conn.execute(
+            'SELECT event_id FROM waitlist WHERE user_id = ?', (session['user_id'],)
+        ).fetchall()
+        waitlisted_event_ids = [row['event_id'] for row in waitlisted_events]
 
-    # Enrich events with an "is_applied" flag
+    # Enrich events with "is_applied" and "is_waitlisted" flags
     enriched_events = [
-        {**event, 'is_applied': event['id'] in applied_event_ids}
+        {**event, 'is_applied': event['id'] in applied_event_ids,
+         'is_waitlisted': event['id'] in waitlisted_event_ids}
         for event in events
     ]
 
@@ -197,21 +366,34 @@ def book_event(event_id):
 
         if not hours or not hours.isdigit() or int(hours) <= 0:
             error_messages.append("Number of Hours must be a positive integer.")
+        elif event['max_hours'] and int(hours) > event['max_hours']:
+            # Could never be promoted from the waitlist and would block everyone behind it
+            error_messages.append(f"Number of Hours cannot exceed this event's limit of {event['max_hours']} hours.")
 
         if error_messages:
             for error in error_messages:
                 flash(error, 'danger')
             return redirect(url_for('book_event', event_id=event_id))
 
+        application = (user_id, event_id, int(hours), description)
         try:
-            # Insert application into the database
-            conn.execute(
-                'INSERT INTO purchases (user_id, event_id, hours, description) VALUES (?, ?, ?, ?)',
-                (user_id, event_id, hours, description)
-            )
-            conn.commit()
-            flash('Successfully applied for the event!', 'success')
+            # Take a seat (or a waitlist spot) and insert the application in one transaction,
+            # so the event counters never drift from purchases or exceed the limits
+            if app.config['GROUP_COMMIT']:
+                # Shares a transaction and commit with other applications queued at the same time;
+                # a timeout raises GroupCommitTimeout (an sqlite3.Error) and nothing is saved
+                applied = get_application_writer().submit(application)
+            else:
+                conn.execute('BEGIN IMMEDIATE')
+                applied = write_applications(conn, [application])[0]
+                conn.commit()
+
+            if applied:
+                flash('Successfully applied for the event!', 'success')
+            else:
+                flash('This event is full. You have been added to the waitlist.', 'info')
         except sqlite3.Error as e:
+            conn.rollback()
             flash(f"An error occurred while processing your application: {e}", 'danger')
         finally:
             conn.close()
@@ -221,6 +403,32 @@ def book_event(event_id):
     conn.close()
     return render_template('book_event.html', event=event)
 
+@app.route('/cancel_application/<int:event_id>', methods=['POST'])
+def cancel_application(event_id):
+    """
+    Cancels the user's application or waitlist entry for an event.
+    The freed seat goes to the next user on the waitlist.
+    """
+    if 'user_id' not in session:
+        flash('Please log in to manage your applications.', 'warning')
+        return redirect(url_for('login'))
+
+    conn = get_db_connection(include_archive=True)
+    try:
+        cancelled = cancel_applications(conn, session['user_id'], event_id)
+        conn.commit()
+        if cancelled:
+            flash('Your application has been cancelled.', 'info')
+        else:
+            flash('You have no application for this event.', 'warning')
+    except sqlite3.Error as e:
+        conn.rollback()
+        flash(f"An error occurred while cancelling your application: {e}", 'danger')
+    finally:
+        conn.close()
+
+    return redirect(url_for('events'))
+
 
 
 @app.route('/admin/dashboard')
@@ -230,14 +438,7 @@ def dashboard():
         return redirect(url_for('index'))
 
     conn = get_db_connection()
-    accounts = conn.execute('''
-        SELECT users.id AS user_id, users.full_name, users.email, users.role,
-               GROUP_CONCAT(events.event_name || " (" || purchases.hours || " hours on " || purchases.created_at || ")") AS events_applied
-        FROM users
-        LEFT JOIN purchases ON users.id = purchases.user_id
-        LEFT JOIN events ON purchases.event_id = events.id
-        GROUP BY users.id
-    ''').fetchall()
+    accounts = fetch_accounts(conn)
 
     events = conn.execute('SELECT * FROM events').fetchall()
     inventory = conn.execute('SELECT * FROM inventory').fetchall()
@@ -260,16 +461,12 @@ def users():
         flash('Access denied.', 'danger')
         return redirect(url_for('index'))
 
-    conn = get_db_connection()
-    accounts = conn.execute('''
-        SELECT users.id AS user_id, users.full_name, users.email, users.role,
-               GROUP_CONCAT(events.event_name || " (" || purchases.hours || " hours on " || purchases.created_at || ")") AS events_applied
-        FROM users
-        LEFT JOIN purchases ON users.id = purchases.user_id
-        LEFT JOIN events ON purchases.event_id = events.id
-        GROUP BY users.id
-    ''').fetchall()
-    return render_template('users.html', accounts=accounts)
+    # Archived applications are only read when explicitly asked for (?history=all)
+    include_archive = request.args.get('history') == 'all'
+    conn = get_db_connection(include_archive=include_archive)
+    accounts = fetch_accounts(conn, include_archive)
+    conn.close()
+    return render_template('users.html', accounts=accounts, include_archive=include_archive)
 
 
 
@@ -295,6 +492,8 @@ def manage_events():
             description = request.form.get('description', '').strip()
             location = request.form.get('location', '').strip()
             event_date = request.form.get('event_date', '').strip()
+            capacity = request.form.get('capacity', '').strip()  # Optional, blank = unlimited
+            max_hours = request.form.get('max_hours', '').strip()  # Optional, blank = unlimited
             selected_products = request.form.getlist('products')  # Selected product IDs
 
             # Error messages list
@@ -311,6 +510,10 @@ def manage_events():
                 error_messages.append("Event Date is required.")
             if not selected_products:
                 error_messages.append("At least one product must be selected.")
+            if capacity and (not capacity.isdigit() or int(capacity) <= 0):
+                error_messages.append("Capacity must be a positive integer.")
+            if max_hours and (not max_hours.isdigit() or int(max_hours) <= 0):
+                error_messages.append("Max Hours must be a positive integer.")
 
             # Validate quantities for selected products
             valid_products = []
@@ -347,8 +550,9 @@ def manage_events():
 
             # Insert the event into the database
             conn.execute(
-                'INSERT INTO events (event_name, description, location, date, created_by) VALUES (?, ?, ?, ?, ?)',
-                (event_name, description, location, event_date, session['user_id'])
+                'INSERT INTO events (event_name, description, location, date, created_by, capacity, max_hours) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (event_name, description, location, event_date, session['user_id'],
+                 int(capacity) if capacity else None, int(max_hours) if max_hours else None)
             )
             event_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
 
@@ -460,6 +664,8 @@ def create_event():
             description = request.form.get('description', '').strip()
             location = request.form.get('location', '').strip()
             event_date = request.form.get('event_date', '').strip()
+            capacity = request.form.get('capacity', '').strip()  # Optional, blank = unlimited
+            max_hours = request.form.get('max_hours', '').strip()  # Optional, blank = unlimited
             selected_products = request.form.getlist('products')  # Selected product IDs
 
             # Error messages list
@@ -476,6 +682,10 @@ def create_event():
                 error_messages.append("Event Date is required.")
             if not selected_products:
                 error_messages.append("At least one product must be selected.")
+            if capacity and (not capacity.isdigit() or int(capacity) <= 0):
+                error_messages.append("Capacity must be a positive integer.")
+            if max_hours and (not max_hours.isdigit() or int(max_hours) <= 0):
+                error_messages.append("Max Hours must be a positive integer.")
 
             # Validate quantities for selected products
             valid_products = []
@@ -512,8 +722,9 @@ def create_event():
 
             # Insert the event into the database
             conn.execute(
-                'INSERT INTO events (event_name, description, location, date, created_by) VALUES (?, ?, ?, ?, ?)',
-                (event_name, description, location, event_date, session['user_id'])
+                'INSERT INTO events (event_name, description, location, date, created_by, capacity, max_hours) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (event_name, description, location, event_date, session['user_id'],
+                 int(capacity) if capacity else None, int(max_hours) if max_hours else None)
             )
             event_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
 
@@ -540,11 +751,17 @@ def create_event():
 
 @app.route('/admin/delete_event/<int:event_id>', methods=['POST'])
 def delete_event(event_id):
+    """
+    Deletes an event and restocks the inventory it used.
+    Its applications, waitlist entries and inventory transactions are deleted too,
+    both the hot rows and any archived ones.
+    """
     if session.get('user_role') != 'admin':
         flash('Access denied.', 'danger')
         return redirect(url_for('index'))
 
-    conn = get_db_connection()
+    # Past events may have had their transactions moved to the archive
+    conn = get_db_connection(include_archive=True)
 
     # Check if the event exists
     event = conn.execute('SELECT * FROM events WHERE id = ?', (event_id,)).fetchone()
@@ -555,7 +772,7 @@ def delete_event(event_id):
 
     # Get the products used in the event
     used_products = conn.execute(
-        'SELECT product_id, quantity_change FROM inventoryTransactions WHERE event_id = ? AND transaction_type = "deduct"',
+        'SELECT product_id, quantity_change FROM all_inventoryTransactions WHERE event_id = ? AND transaction_type = "deduct"',
         (event_id,)
     ).fetchall()
 
@@ -568,7 +785,12 @@ def delete_event(event_id):
 
     # Delete the event and associated transactions
     conn.execute('DELETE FROM events WHERE id = ?', (event_id,))
+    conn.execute('DELETE FROM waitlist WHERE event_id = ?', (event_id,))
+    conn.execute('DELETE FROM purchases WHERE event_id = ?', (event_id,))
     conn.execute('DELETE FROM inventoryTransactions WHERE event_id = ?', (event_id,))
+    if is_archive_attached(conn):
+        conn.execute('DELETE FROM archive.inventoryTransactions WHERE event_id = ?', (event_id,))
+        conn.execute('DELETE FROM archive.purchases WHERE event_id = ?', (event_id,))
     conn.commit()
     conn.close()
 
@@ -630,14 +852,15 @@ def delete_user(user_id):
         flash('You cannot delete your own account!', 'danger')
         return redirect(url_for('users'))
 
-    with get_db_connection() as conn:
+    with get_db_connection(include_archive=True) as conn:
         # Check if the user exists
         user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
         if not user:
             flash('User not found.', 'danger')
             return redirect(url_for('users'))
 
-        # Proceed with deletion
+        # Free the user's seats (hot and archived) for waitlisted applicants, then delete the user
+        cancel_applications(conn, user_id)
         conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
         conn.commit()
 
@@ -647,4 +870,8 @@ def delete_user(user_id):
 
 
 if __name__ == "__main__":
+    # Optional in-process snapshots, e.g. FYAY_BACKUP_INTERVAL=3600 for one per hour.
+    # The debug reloader runs this file twice; only its child process (WERKZEUG_RUN_MAIN) serves requests.
+    if os.environ.get('FYAY_BACKUP_INTERVAL') and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_backup_scheduler(float(os.environ['FYAY_BACKUP_INTERVAL']), db_path=app.config['DATABASE'])
     app.run(debug=True)
@@ -0,0 +1,187 @@
+import argparse
+import os
+import sqlite3
+from datetime import date, timedelta
+
+DATABASE = "fyay.db"
+ARCHIVE_DATABASE = "fyay_archive.db"
+
+# Columns copied verbatim (ids included) so archived rows keep their identity
+PURCHASE_COLUMNS = "id, user_id, event_id, hours, description, created_at"
+TRANSACTION_COLUMNS = "id, product_id, quantity_change, event_id, transaction_type, created_at"
+# Column summed when checking that a batch arrived intact
+SUM_COLUMNS = {'purchases': 'hours', 'inventoryTransactions': 'quantity_change'}
+
+
+def create_archive_tables(conn, schema="archive"):
+    """
+    Create the cold copies of purchases and inventoryTransactions in the attached archive.
+    Foreign keys are left out on purpose: the events and users they point to stay in the hot database.
+    """
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.purchases (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            event_id INTEGER NOT NULL,
+            hours INTEGER NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP
+        );
+    ''')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_purchases_user_id ON purchases (user_id);')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_purchases_event_id ON purchases (event_id);')
+
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.inventoryTransactions (
+            id INTEGER PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            quantity_change INTEGER NOT NULL,
+            event_id INTEGER,
+            transaction_type TEXT CHECK(transaction_type IN ('add', 'deduct')) NOT NULL,
+            created_at TIMESTAMP
+        );
+    ''')
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS {schema}.idx_inventoryTransactions_event_id ON inventoryTransactions (event_id);'
+    )
+
+
+def attach_archive(conn, archive_path=ARCHIVE_DATABASE):
+    """
+    Attach the archive database as "archive" and expose hot + cold rows through
+    the temporary views all_purchases and all_inventoryTransactions.
+    When no archive file exists yet the views cover the hot tables only and False is returned.
+    Hot rows already copied to the archive are left out of the hot side, so a batch caught
+    between archive_old_records' copy and delete is never seen twice.
+    """
+    attached = os.path.exists(archive_path)
+    if attached:
+        conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+
+    for view, table, columns in (('all_purchases', 'purchases', PURCHASE_COLUMNS),
+                                 ('all_inventoryTransactions', 'inventoryTransactions', TRANSACTION_COLUMNS)):
+        select = f'SELECT {columns} FROM main.{table}'
+        if attached:
+            select += (f' WHERE id NOT IN (SELECT id FROM archive.{table})'
+                       f' UNION ALL SELECT {columns} FROM archive.{table}')
+        conn.execute(f'CREATE TEMP VIEW IF NOT EXISTS {view} AS {select}')
+    return attached
+
+
+def is_archive_attached(conn):
+    """
+    Check whether the archive database is attached to this connection.
+    """
+    return any(row[1] == 'archive' for row in conn.execute('PRAGMA database_list'))
+
+
+def batch_totals(conn, schema, table, ids):
+    """
+    Row count and sum of the given ids in one copy of a table, used to prove that archiving only moved rows.
+    """
+    placeholders = ', '.join('?' * len(ids))
+    row = conn.execute(
+        f'SELECT COUNT(*), COALESCE(SUM({SUM_COLUMNS[table]}), 0) FROM {schema}.{table} WHERE id IN ({placeholders})',
+        ids
+    ).fetchone()
+    return (row[0], row[1])
+
+
+def _move_batch(conn, table, columns, ids):
+    """
+    Copy one batch of rows into the archive, then delete them from the hot table.
+    A transaction spanning two WAL databases is not atomic as a whole, so the copy is
+    committed first; INSERT OR IGNORE keeps a re-run idempotent if a previous run
+    stopped between the two transactions, and no row can be lost.
+    Totals are compared over the batch's ids only, so concurrent writes elsewhere in
+    the tables do not matter. Raises RuntimeError on a mismatch.
+    """
+    placeholders = ', '.join('?' * len(ids))
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        hot = batch_totals(conn, 'main', table, ids)
+        conn.execute(
+            f'INSERT OR IGNORE INTO archive.{table} ({columns}) '
+            f'SELECT {columns} FROM main.{table} WHERE id IN ({placeholders})',
+            ids
+        )
+        cold = batch_totals(conn, 'archive', table, ids)
+        if cold != hot:
+            raise RuntimeError(f"Archive totals mismatch in {table}: hot={hot}, archived={cold}")
+        conn.commit()
+
+        # Only delete rows that are safely in the archive (delete_event may remove some meanwhile)
+        conn.execute('BEGIN IMMEDIATE')
+        deleted = conn.execute(
+            f'DELETE FROM main.{table} WHERE id IN ({placeholders}) AND id IN (SELECT id FROM archive.{table})',
+            ids
+        ).rowcount
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    return deleted
+
+
+def _archive_table(conn, table, columns, where, params, batch_size):
+    moved = 0
+    last_id = 0
+    while True:
+        ids = [row[0] for row in conn.execute(
+            f'SELECT id FROM main.{table} WHERE id > ? AND {where} ORDER BY id LIMIT ?',
+            (last_id, *params, batch_size)
+        ).fetchall()]
+        if not ids:
+            return moved
+        moved += _move_batch(conn, table, columns, ids)
+        last_id = ids[-1]
+
+
+def archive_old_records(cutoff, db_path=DATABASE, archive_path=ARCHIVE_DATABASE, batch_size=500, vacuum=False):
+    """
+    Move purchases and inventoryTransactions of events dated before `cutoff` (YYYY-MM-DD)
+    into the archive database, `batch_size` rows per transaction.
+    Transactions whose event has been deleted are archived once they are older than the cutoff.
+    Raises RuntimeError if a batch's row count or sum differs between the hot and archived copies.
+    Returns a dict with the number of rows moved per table.
+    """
+    conn = sqlite3.connect(db_path, timeout=10)
+    try:
+        conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+        with conn:
+            create_archive_tables(conn)
+
+        moved = {
+            'purchases': _archive_table(
+                conn, 'purchases', PURCHASE_COLUMNS,
+                'created_at < ? AND event_id IN (SELECT id FROM main.events WHERE date < ?)',
+                (cutoff, cutoff), batch_size
+            ),
+            'inventoryTransactions': _archive_table(
+                conn, 'inventoryTransactions', TRANSACTION_COLUMNS,
+                'created_at < ? AND (event_id IS NULL OR event_id IN (SELECT id FROM main.events WHERE date < ?))',
+                (cutoff, cutoff), batch_size
+            ),
+        }
+
+        # Keep the hot file and its WAL small once the rows are gone
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        if vacuum:
+            conn.execute('VACUUM main')
+
+        return moved
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old purchases and inventory transactions into the archive database.")
+    parser.add_argument('--before', default=(date.today() - timedelta(days=365)).isoformat(),
+                        help="Archive rows of events dated before this day (YYYY-MM-DD). Defaults to one year ago.")
+    parser.add_argument('--batch-size', type=int, default=500, help="Rows moved per transaction.")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM the hot database afterwards to shrink the file.")
+    args = parser.parse_args()
+
+    moved = archive_old_records(args.before, batch_size=args.batch_size, vacuum=args.vacuum)
+    print(f"Archived {moved['purchases']} purchases and {moved['inventoryTransactions']} inventory transactions.")
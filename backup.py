@@ -0,0 +1,200 @@
+import argparse
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+DATABASE = "fyay.db"
+BACKUP_DIR = "backups"
+SNAPSHOT_PREFIX = "fyay-"
+SNAPSHOT_SUFFIX = ".db.gz"
+
+logger = logging.getLogger(__name__)
+
+
+def positive_int(value):
+    """
+    argparse type for options that must be at least 1.
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+class BackupRestarted(Exception):
+    """
+    Raised from the progress callback when writers keep restarting a stepped backup.
+    """
+
+
+def check_integrity(conn):
+    """
+    Run PRAGMA integrity_check and raise RuntimeError unless the database is sound.
+    """
+    result = [row[0] for row in conn.execute('PRAGMA integrity_check').fetchall()]
+    if result != ['ok']:
+        raise RuntimeError(f"Integrity check failed: {'; '.join(result[:5])}")
+
+
+def copy_database(src, dst, pages=256, step_sleep=0.01, max_restarts=3):
+    """
+    Copy src into dst with SQLite's online backup API, `pages` pages per step and
+    `step_sleep` seconds between steps so writers only wait for one short step at a time.
+    A write from another connection restarts a stepped backup; after `max_restarts`
+    restarts the copy is finished in a single step instead (a read transaction, which
+    does not block writers in WAL mode).
+    """
+    last_remaining = None
+    restarts = 0
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining, restarts
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise BackupRestarted()
+        last_remaining = remaining
+        time.sleep(step_sleep)
+
+    try:
+        src.backup(dst, pages=pages, progress=progress)
+    except BackupRestarted:
+        logger.info("Backup restarted %d times by writers, finishing in one step.", restarts)
+        src.backup(dst, pages=-1)
+
+
+def rotate_snapshots(backup_dir=BACKUP_DIR, keep=7):
+    """
+    Delete all but the `keep` most recent snapshots in backup_dir.
+    Returns the deleted paths.
+    """
+    if keep < 1:
+        raise ValueError("keep must be at least 1 so the newest snapshot survives rotation.")
+    snapshots = sorted(glob.glob(os.path.join(backup_dir, f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}")))
+    expired = snapshots[:-keep]
+    for path in expired:
+        os.remove(path)
+    return expired
+
+
+def backup_database(db_path=DATABASE, backup_dir=BACKUP_DIR, keep=7, pages=256, step_sleep=0.01):
+    """
+    Take a compressed, integrity-checked snapshot of a live database without stopping the app.
+    The copy is checked before it is compressed, and old snapshots are rotated out afterwards.
+    Returns the path of the new snapshot.
+    """
+    if keep < 1:
+        raise ValueError("keep must be at least 1 so the newest snapshot survives rotation.")
+    os.makedirs(backup_dir, exist_ok=True)
+    name = f"{SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+    copy_path = os.path.join(backup_dir, f"{name}.db")
+    snapshot_path = os.path.join(backup_dir, f"{name}{SNAPSHOT_SUFFIX}")
+
+    src = sqlite3.connect(db_path, timeout=10)
+    dst = sqlite3.connect(copy_path)
+    try:
+        copy_database(src, dst, pages=pages, step_sleep=step_sleep)
+        # Store the copy as a single self-contained file before compressing it
+        dst.execute('PRAGMA journal_mode=DELETE')
+        check_integrity(dst)
+        dst.close()
+
+        with open(copy_path, 'rb') as copy_file, gzip.open(snapshot_path, 'wb') as snapshot_file:
+            shutil.copyfileobj(copy_file, snapshot_file)
+    finally:
+        dst.close()
+        src.close()
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+
+    rotate_snapshots(backup_dir, keep)
+    return snapshot_path
+
+
+def restore_snapshot(snapshot_path, dest_path, db_path=DATABASE):
+    """
+    Decompress a snapshot into a scratch path and check its integrity.
+    The copy is written under a temporary name next to dest_path and only moved into
+    place once the check passes, so dest_path never holds an unverified copy.
+    Refuses to overwrite the live database or an existing file.
+    Returns dest_path.
+    """
+    if os.path.abspath(dest_path) == os.path.abspath(db_path):
+        raise ValueError("Refusing to restore over the live database; restore into a scratch path.")
+    if os.path.exists(dest_path):
+        raise FileExistsError(f"{dest_path} already exists.")
+
+    partial_path = f"{dest_path}.partial"
+    try:
+        with gzip.open(snapshot_path, 'rb') as snapshot_file, open(partial_path, 'wb') as partial_file:
+            shutil.copyfileobj(snapshot_file, partial_file)
+
+        conn = sqlite3.connect(partial_path)
+        try:
+            check_integrity(conn)
+        finally:
+            conn.close()
+        os.replace(partial_path, dest_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return dest_path
+
+
+def start_backup_scheduler(interval, **backup_options):
+    """
+    Take a snapshot every `interval` seconds on a daemon thread.
+    Failures are logged and retried at the next interval.
+    Returns a threading.Event that stops the scheduler when set.
+    """
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                path = backup_database(**backup_options)
+                logger.info("Database snapshot written to %s", path)
+            except Exception:
+                logger.exception("Scheduled database backup failed")
+
+    threading.Thread(target=run, name="fyay-backup", daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online backups and snapshot restores of fyay.db.")
+    parser.add_argument('--db', default=DATABASE, help="Database to back up.")
+    parser.add_argument('--dir', default=BACKUP_DIR, help="Directory holding the snapshots.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backup_parser = subparsers.add_parser('backup', help="Take one snapshot now.")
+    schedule_parser = subparsers.add_parser('schedule', help="Take a snapshot every --interval seconds.")
+    schedule_parser.add_argument('--interval', type=float, default=3600)
+    for subparser in (backup_parser, schedule_parser):
+        subparser.add_argument('--keep', type=positive_int, default=7, help="Number of snapshots to keep.")
+        subparser.add_argument('--pages', type=int, default=256, help="Pages copied per step.")
+        subparser.add_argument('--sleep', type=float, default=0.01, help="Seconds to sleep between steps.")
+
+    restore_parser = subparsers.add_parser('restore', help="Restore a snapshot into a scratch path.")
+    restore_parser.add_argument('snapshot')
+    restore_parser.add_argument('dest')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'restore':
+        print(f"Restored {args.snapshot} into {restore_snapshot(args.snapshot, args.dest, args.db)}.")
+    else:
+        options = dict(db_path=args.db, backup_dir=args.dir, keep=args.keep, pages=args.pages, step_sleep=args.sleep)
+        if args.command == 'backup':
+            print(f"Snapshot written to {backup_database(**options)}.")
+        else:
+            start_backup_scheduler(args.interval, **options)
+            while True:
+                time.sleep(3600)
@@ -0,0 +1,362 @@
+"""
+Load and consistency checks run against a scratch database, never fyay.db.
+
+    python benchmark.py capacity --users 300 --threads 16 --capacity 50
+    python benchmark.py backup --rows 1000000 --threads 4
+    python benchmark.py group-commit --threads 32 --seconds 10
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from app import app
+from archive import archive_old_records, attach_archive
+from backup import backup_database
+from database import create_tables
+
+
+def create_scratch_database(directory, users):
+    """
+    Create the schema in a scratch file and register `users` users.
+    Returns the path of the database.
+    """
+    db_path = os.path.join(directory, "bench.db")
+    create_tables(db_path)
+    conn = sqlite3.connect(db_path)
+    password_hash = generate_password_hash("password")
+    conn.executemany(
+        'INSERT INTO users (full_name, email, password) VALUES (?, ?, ?)',
+        [(f"User {i}", f"user{i}@example.com", password_hash) for i in range(users)]
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def logged_in_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['user_role'] = 'user'
+    return client
+
+
+def run_threads(target, work, threads):
+    """
+    Split `work` over `threads` threads calling target(item) and wait for all of them.
+    """
+    chunks = [work[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=lambda chunk=chunk: [target(item) for item in chunk]) for chunk in chunks]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report_latency(label, samples, seconds):
+    print(f"{label}: {len(samples)} requests in {seconds:.1f}s ({len(samples) / seconds:.0f}/s), "
+          f"p50={percentile(samples, 0.50) * 1000:.1f}ms, p99={percentile(samples, 0.99) * 1000:.1f}ms, "
+          f"max={max(samples) * 1000:.1f}ms")
+
+
+def measure_bookings(event_id, user_ids, threads, until):
+    """
+    POST to book_event from `threads` threads until until() returns True.
+    Returns (per-request latencies in seconds, elapsed seconds).
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def book(user_id):
+        client = logged_in_client(user_id)
+        while not until():
+            started = time.perf_counter()
+            client.post(f'/book_event/{event_id}', data={'hours': '1', 'date': '2030-01-01', 'description': ''})
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    run_threads(book, user_ids[:threads], threads)
+    return latencies, time.perf_counter() - started
+
+
+def fill_purchases(db_path, event_id, user_ids, rows):
+    """
+    Grow the scratch database with `rows` historical applications.
+    """
+    conn = sqlite3.connect(db_path)
+    padding = "x" * 100
+    for start in range(0, rows, 50000):
+        conn.executemany(
+            'INSERT INTO purchases (user_id, event_id, hours, description) VALUES (?, ?, ?, ?)',
+            [(random.choice(user_ids), event_id, 1, padding) for _ in range(start, min(rows, start + 50000))]
+        )
+        conn.commit()
+    conn.close()
+
+
+def measure_backup(args):
+    """
+    Compare book_event latency with and without an online backup running on a large database.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = create_scratch_database(directory, args.threads)
+        app.config['DATABASE'] = db_path
+
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            'INSERT INTO events (event_name, location, date) VALUES (?, ?, ?)', ("Backup load", "Scratch", "2000-01-01")
+        )
+        conn.commit()
+        event_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users').fetchall()]
+        conn.close()
+
+        fill_purchases(db_path, event_id, user_ids, args.rows)
+        print(f"Database size: {os.path.getsize(db_path) / 1024 / 1024:.0f} MB")
+
+        baseline_end = time.perf_counter() + args.seconds
+        report_latency("Without backup", *measure_bookings(
+            event_id, user_ids, args.threads, lambda: time.perf_counter() > baseline_end
+        ))
+
+        backup_done = threading.Event()
+        backup_seconds = []
+
+        def run_backup():
+            started = time.perf_counter()
+            backup_database(db_path, os.path.join(directory, "backups"), pages=args.pages, step_sleep=args.sleep)
+            backup_seconds.append(time.perf_counter() - started)
+            backup_done.set()
+
+        backup_thread = threading.Thread(target=run_backup)
+        backup_thread.start()
+        report_latency("During backup", *measure_bookings(event_id, user_ids, args.threads, backup_done.is_set))
+        backup_thread.join()
+        print(f"Backup took {backup_seconds[0]:.1f}s")
+
+
+def measure_group_commit(args):
+    """
+    Compare sustained book_event throughput and latency with one commit per request
+    against the group-commit writer.
+    """
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        db_path = create_scratch_database(directory, args.threads)
+        app.config['DATABASE'] = db_path
+        app.config['GROUP_COMMIT_MAX_BATCH'] = args.max_batch
+        app.config['GROUP_COMMIT_MAX_WAIT_MS'] = args.max_wait_ms
+
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            'INSERT INTO events (event_name, location, date) VALUES (?, ?, ?)', ("Popular event", "Scratch", "2000-01-01")
+        )
+        conn.commit()
+        event_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users').fetchall()]
+        conn.close()
+
+        for label, group_commit in (("Commit per request", False), ("Group commit", True)):
+            app.config['GROUP_COMMIT'] = group_commit
+            end = time.perf_counter() + args.seconds
+            report_latency(label, *measure_bookings(
+                event_id, user_ids, args.threads, lambda: time.perf_counter() > end
+            ))
+
+
+def check_waitlist_order(db_path):
+    """
+    Walk through a fixed booking sequence on an event limited to 10 hours and verify
+    that oversized applications are rejected and the waitlist is served first come, first served.
+    Returns a list of problems.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        'INSERT INTO events (event_name, location, date, max_hours) VALUES (?, ?, ?, ?)',
+        ("Waitlist order", "Scratch", "2000-01-01", 10)
+    )
+    conn.commit()
+    event_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    a, b, c, d = [row[0] for row in conn.execute('SELECT id FROM users ORDER BY id LIMIT 4').fetchall()]
+
+    def book(user_id, hours):
+        logged_in_client(user_id).post(f'/book_event/{event_id}', data={
+            'hours': str(hours), 'date': '2030-01-01', 'description': ''
+        })
+
+    def state():
+        booked = {row[0] for row in conn.execute('SELECT user_id FROM purchases WHERE event_id = ?', (event_id,))}
+        waiting = [row[0] for row in conn.execute('SELECT user_id FROM waitlist WHERE event_id = ? ORDER BY id', (event_id,))]
+        return booked, waiting
+
+    problems = []
+    book(a, 8)
+    book(b, 20)
+    book(c, 5)
+    book(d, 2)
+    if state() != ({a}, [c, d]):
+        problems.append(f"expected A booked and C, D waiting (oversized B rejected), got {state()}")
+
+    logged_in_client(a).post(f'/cancel_application/{event_id}')
+    if state() != ({c, d}, []):
+        problems.append(f"expected C and D promoted after A cancelled, got {state()}")
+    conn.close()
+    return problems
+
+
+def check_archived_seat(db_path, archive_path):
+    """
+    Archive the only application of a full event, then cancel it: the seat must be freed
+    and the waitlisted user promoted, since the counters include archived applications.
+    Returns a list of problems.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        'INSERT INTO events (event_name, location, date, capacity) VALUES (?, ?, ?, ?)',
+        ("Archived seat", "Scratch", "2000-01-01", 1)
+    )
+    conn.commit()
+    event_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    a, b = [row[0] for row in conn.execute('SELECT id FROM users ORDER BY id LIMIT 2').fetchall()]
+    conn.close()
+
+    for user_id in (a, b):
+        logged_in_client(user_id).post(f'/book_event/{event_id}', data={
+            'hours': '1', 'date': '2030-01-01', 'description': ''
+        })
+    archive_old_records('9999-12-31', db_path, archive_path)
+
+    problems = []
+    if b'Applied' not in logged_in_client(a).get('/events').data:
+        problems.append("archived applicant is not shown as applied")
+    logged_in_client(a).post(f'/cancel_application/{event_id}')
+
+    conn = sqlite3.connect(db_path)
+    attach_archive(conn, archive_path)
+    booked = [row[0] for row in conn.execute('SELECT user_id FROM all_purchases WHERE event_id = ?', (event_id,))]
+    seats_filled = conn.execute('SELECT seats_filled FROM events WHERE id = ?', (event_id,)).fetchone()[0]
+    conn.close()
+    if (booked, seats_filled) != ([b], 1):
+        problems.append(f"expected B promoted into A's archived seat, got booked={booked}, seats_filled={seats_filled}")
+    return problems
+
+
+def check_capacity(args):
+    """
+    Book and cancel concurrently through the book_event/cancel_application routes while
+    applications are being archived, then verify the event counters against hot and
+    archived purchases and the waitlist.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = create_scratch_database(directory, args.users)
+        archive_path = os.path.join(directory, "bench_archive.db")
+        app.config['DATABASE'] = db_path
+        app.config['ARCHIVE_DATABASE'] = archive_path
+        app.config['GROUP_COMMIT'] = args.group_commit
+
+        problems = check_waitlist_order(db_path)
+        problems += check_archived_seat(db_path, archive_path)
+
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        conn.execute(
+            'INSERT INTO events (event_name, location, date, capacity, max_hours) VALUES (?, ?, ?, ?, ?)',
+            ("Capacity check", "Scratch", "2000-01-01", args.capacity, args.max_hours)
+        )
+        conn.commit()
+        event_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+
+        user_ids = [row['id'] for row in conn.execute('SELECT id FROM users').fetchall()]
+        cancelling = set(random.sample(user_ids, len(user_ids) // 4))
+
+        def apply(user_id):
+            client = logged_in_client(user_id)
+            client.post(f'/book_event/{event_id}', data={
+                'hours': str(random.randint(1, 5)), 'date': '2030-01-01', 'description': ''
+            })
+            if user_id in cancelling:
+                client.post(f'/cancel_application/{event_id}')
+
+        # Keep archiving the event's applications while users book and cancel
+        booking_done = threading.Event()
+
+        def archive_continuously():
+            while not booking_done.is_set():
+                archive_old_records('9999-12-31', db_path, archive_path, batch_size=20)
+
+        archiver = threading.Thread(target=archive_continuously)
+        archiver.start()
+        run_threads(apply, user_ids, args.threads)
+        booking_done.set()
+        archiver.join()
+
+        attach_archive(conn, archive_path)
+        event = conn.execute('SELECT * FROM events WHERE id = ?', (event_id,)).fetchone()
+        seats, hours = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(hours), 0) FROM all_purchases WHERE event_id = ?', (event_id,)
+        ).fetchone()
+        waiting = conn.execute('SELECT COUNT(*) FROM waitlist WHERE event_id = ?', (event_id,)).fetchone()[0]
+        head = conn.execute(
+            'SELECT hours FROM waitlist WHERE event_id = ? ORDER BY id LIMIT 1', (event_id,)
+        ).fetchone()
+        conn.close()
+
+        print(f"seats_filled={event['seats_filled']} (purchases: {seats}), "
+              f"hours_booked={event['hours_booked']} (purchases: {hours}), waitlisted={waiting}")
+
+        if (event['seats_filled'], event['hours_booked']) != (seats, hours):
+            problems.append("counters drifted from purchases")
+        if args.capacity and seats > args.capacity:
+            problems.append("capacity exceeded")
+        if args.max_hours and hours > args.max_hours:
+            problems.append("max hours exceeded")
+        if head and (not args.capacity or seats < args.capacity) and (
+                not args.max_hours or hours + head['hours'] <= args.max_hours):
+            problems.append("the first waitlisted application fits but was not promoted")
+        if problems:
+            raise SystemExit("FAILED: " + ", ".join(problems))
+        print("OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load and consistency checks against a scratch database.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    capacity_parser = subparsers.add_parser('capacity', help="Concurrent bookings and cancellations against a limited event.")
+    capacity_parser.add_argument('--users', type=int, default=300)
+    capacity_parser.add_argument('--threads', type=int, default=16)
+    capacity_parser.add_argument('--capacity', type=int, default=50)
+    capacity_parser.add_argument('--max-hours', type=int, default=None)
+    capacity_parser.add_argument('--group-commit', action='store_true', help="Book through the group-commit writer.")
+    capacity_parser.set_defaults(func=check_capacity)
+
+    backup_parser = subparsers.add_parser('backup', help="book_event latency during an online backup of a large database.")
+    backup_parser.add_argument('--rows', type=int, default=1000000, help="Historical purchases in the scratch database.")
+    backup_parser.add_argument('--threads', type=int, default=4)
+    backup_parser.add_argument('--seconds', type=float, default=10, help="Length of the baseline run.")
+    backup_parser.add_argument('--pages', type=int, default=256)
+    backup_parser.add_argument('--sleep', type=float, default=0.01)
+    backup_parser.set_defaults(func=measure_backup)
+
+    group_commit_parser = subparsers.add_parser('group-commit', help="book_event throughput with and without group commit.")
+    group_commit_parser.add_argument('--threads', type=int, default=32)
+    group_commit_parser.add_argument('--seconds', type=float, default=10, help="Length of each run.")
+    group_commit_parser.add_argument('--max-batch', type=int, default=64)
+    group_commit_parser.add_argument('--max-wait-ms', type=float, default=5)
+    group_commit_parser.add_argument('--dir', default=None, help="Directory for the scratch database (use a real disk, not tmpfs).")
+    group_commit_parser.set_defaults(func=measure_group_commit)
+
+    args = parser.parse_args()
+    args.func(args)
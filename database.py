@@ -1,9 +1,44 @@
 import sqlite3
 
-def create_tables():
-    conn = sqlite3.connect("fyay.db")
+from archive import attach_archive
+
+# Capacity columns added to events after the first release; applied to older databases by migrate_events()
+EVENT_CAPACITY_COLUMNS = [
+    ('capacity', 'INTEGER'),                         # Max number of applications, NULL = unlimited
+    ('max_hours', 'INTEGER'),                        # Max total booked hours, NULL = unlimited
+    ('seats_filled', 'INTEGER NOT NULL DEFAULT 0'),  # Maintained counter of applications
+    ('hours_booked', 'INTEGER NOT NULL DEFAULT 0'),  # Maintained counter of booked hours
+]
+
+def migrate_events(cursor):
+    """
+    Add the capacity columns to an existing events table and backfill the counters from purchases.
+    The counters include archived applications, so the cursor's connection must have the
+    all_purchases view from archive.attach_archive().
+    """
+    existing = {row[1] for row in cursor.execute('PRAGMA table_info(events)').fetchall()}
+    missing = [(name, definition) for name, definition in EVENT_CAPACITY_COLUMNS if name not in existing]
+    for name, definition in missing:
+        cursor.execute(f'ALTER TABLE events ADD COLUMN {name} {definition}')
+
+    if 'seats_filled' in dict(missing):
+        cursor.execute('''
+            UPDATE events SET
+                seats_filled = (SELECT COUNT(*) FROM all_purchases WHERE all_purchases.event_id = events.id),
+                hours_booked = (SELECT COALESCE(SUM(hours), 0) FROM all_purchases WHERE all_purchases.event_id = events.id)
+        ''')
+
+def create_tables(db_path="fyay.db", archive_path="fyay_archive.db"):
+    """
+    Create any missing tables and bring older databases up to date.
+    Safe to run repeatedly; the app runs it on the first connection to each database.
+    """
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
+    # WAL lets readers (including online backups) run alongside writers; the setting persists in the file
+    cursor.execute('PRAGMA journal_mode=WAL')
+
     # Create users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -25,6 +60,10 @@ def create_tables():
             location TEXT NOT NULL,
             date TIMESTAMP NOT NULL,
             created_by INTEGER,
+            capacity INTEGER,
+            max_hours INTEGER,
+            seats_filled INTEGER NOT NULL DEFAULT 0,
+            hours_booked INTEGER NOT NULL DEFAULT 0,
             FOREIGN KEY (created_by) REFERENCES users (id) ON DELETE SET NULL
         );
     ''')
@@ -43,6 +82,21 @@ def create_tables():
         );
     ''')
 
+    # Create waitlist table (applications over an event's capacity, promoted in id order)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            event_id INTEGER NOT NULL,
+            hours INTEGER NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+            FOREIGN KEY (event_id) REFERENCES events (id) ON DELETE CASCADE
+        );
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_event_id ON waitlist (event_id, id);')
+
     # Create inventory table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS inventory (
@@ -81,6 +135,9 @@ def create_tables():
         );
     ''')
 
+    attach_archive(conn, archive_path)
+    migrate_events(cursor)
+
     conn.commit()
     conn.close()
 
@@ -0,0 +1,179 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class GroupCommitTimeout(sqlite3.OperationalError):
+    """
+    Raised by submit() when an item was not written in time; the item is dropped from the queue.
+    Subclasses sqlite3.Error so routes report it like any other database error.
+    """
+
+
+class GroupCommitUnavailable(sqlite3.OperationalError):
+    """
+    Raised by submit() when the writer thread is not running; the item is not written.
+    """
+
+
+def _is_locked(error):
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+
+class GroupCommitWriter:
+    """
+    Funnel writes from many request threads through one writer thread that commits them in groups.
+
+    Each submitted item waits in a queue; the writer collects up to `max_batch_size` items,
+    waiting at most `max_wait` seconds after the first one, and passes them to
+    write_batch(conn, items) inside a single transaction. write_batch returns one result
+    per item, which is handed back to the submitting thread once the transaction is committed.
+    If a batch fails, its items are retried one by one so each request gets its own error,
+    unless the database is locked, in which case retrying alone would only wait longer.
+    """
+
+    def __init__(self, connect, write_batch, max_batch_size=64, max_wait=0.005):
+        self.connect = connect
+        self.write_batch = write_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, name="fyay-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, item, timeout=30):
+        """
+        Queue an item and block until its batch is committed.
+        Returns write_batch's result for the item, or raises the error that made it fail.
+        Raises GroupCommitTimeout if the item was not picked up within `timeout` seconds;
+        it is then cancelled and never written.
+        """
+        if not self.is_alive():
+            raise GroupCommitUnavailable("The group-commit writer is not running; nothing was saved.")
+        future = Future()
+        self._queue.put((item, future))
+        # The writer may have died meanwhile; its shutdown fails everything queued before this check
+        if not self._alive and future.cancel():
+            raise GroupCommitUnavailable("The group-commit writer is not running; nothing was saved.")
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise GroupCommitTimeout(f"Timed out after {timeout}s waiting for the database; nothing was saved.")
+            # Already being written: its outcome is about to be known
+            return future.result()
+
+    def is_alive(self):
+        return self._alive and self._thread.is_alive()
+
+    def close(self):
+        """
+        Write whatever is queued, then stop the writer thread.
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        batch = []
+        error = None
+        conn = None
+        try:
+            conn = self.connect()
+            stopping = False
+            while not stopping:
+                entry = self._queue.get()
+                if entry is _STOP:
+                    break
+
+                batch = [entry]
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    try:
+                        entry = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if entry is _STOP:
+                        stopping = True
+                        break
+                    batch.append(entry)
+
+                # Skip items whose submitter timed out and cancelled them
+                batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+                if batch:
+                    self._commit(conn, batch)
+                batch = []
+        except Exception as e:
+            logger.exception("Group-commit writer stopped unexpectedly")
+            error = e
+        finally:
+            if conn is not None:
+                conn.close()
+            self._shut_down(batch, error)
+
+    def _shut_down(self, batch, error):
+        """
+        Mark the writer dead, then fail the batch in flight and everything still queued,
+        so no submitter waits for its timeout.
+        """
+        self._alive = False
+        reason = f" ({error})" if error else ""
+        unavailable = GroupCommitUnavailable(f"The group-commit writer is not running{reason}; nothing was saved.")
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(unavailable)
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not _STOP and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(unavailable)
+
+    def _commit(self, conn, batch):
+        error = self._write(conn, batch)
+        if error is None:
+            return
+        if len(batch) == 1 or not isinstance(error, sqlite3.Error) or _is_locked(error):
+            self._fail(batch, error)
+            return
+
+        # Find the failing item(s): every other request still gets written
+        for position, entry in enumerate(batch):
+            error = self._write(conn, [entry])
+            if error is None:
+                continue
+            if _is_locked(error):
+                self._fail(batch[position:], error)
+                return
+            self._fail([entry], error)
+
+    def _write(self, conn, batch):
+        """
+        Write a batch in one transaction and hand out the results.
+        Returns the exception instead of raising it, leaving the futures unresolved.
+        """
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            results = self.write_batch(conn, [item for item, _ in batch])
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            return e
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+        return None
+
+    def _fail(self, batch, error):
+        logger.warning("Group commit of %d item(s) failed: %s", len(batch), error)
+        for _, future in batch:
+            future.set_exception(error)